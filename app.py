@@ -2,7 +2,13 @@ import streamlit as st
 from datetime import date, timedelta
 import json
 import os
+import copy
+import shutil
 import hashlib
+import math
+import bisect
+import threading
+import uuid
 import pandas as pd
 import altair as alt
 from pathlib import Path
@@ -24,29 +30,33 @@ def prossimo_giorno_lavorativo(d: date) -> date:
 def aggiungi_giorno_lavorativo(d: date) -> date:
     return prossimo_giorno_lavorativo(d + timedelta(days=1))
 
-def safe_date(s):
+def parse_data(s):
+    """Data ISO -> date, None se mancante o non valida (niente fallback a oggi)."""
     if isinstance(s, date):
         return s
     try:
         return date.fromisoformat(str(s))
     except Exception:
-        return prossimo_giorno_lavorativo(date.today())
+        return None
 
 # =========================
 # NORMALIZZAZIONI
 # =========================
-def norm_materiale(x: str) -> str:
-    x = (x or "").strip()
-    xl = x.lower()
-    if "allu" in xl:
-        return "Alluminio"
-    if xl == "pvc" or x == "":
+MATERIALI = ("PVC", "Alluminio")
+TIPOLOGIE = ("Battente", "Scorrevole", "Struttura speciale")
+CLUSTERS = ("Battente", "Scorrevole/Speciale")
+
+def parse_materiale(x: str):
+    """Ritorna il codice materiale (PVC | Alluminio) oppure None se non riconosciuto."""
+    xl = str(x or "").strip().lower()
+    if xl == "pvc":
         return "PVC"
-    # fallback
-    return "PVC"
+    if xl in ("alluminio", "allu", "all."):
+        return "Alluminio"
+    return None
 
 def norm_tipologia(x: str) -> str:
-    x = (x or "").strip()
+    x = str(x or "").strip()
     xl = x.lower()
     if xl in ("battente",):
         return "Battente"
@@ -63,6 +73,110 @@ def tipologia_cluster(tip: str) -> str:
         return "Scorrevole/Speciale"
     return "Battente"
 
+# =========================
+# SCHEMA ORDINI (versionato)
+# Ogni riga ordine viene validata e normalizzata UNA volta, in scrittura:
+#  - materiale / tipologia / cluster: codici ammessi (MATERIALI, TIPOLOGIE, CLUSTERS)
+#  - date: oggetti date in memoria, ISO nel file JSON
+# Le righe non valide non vengono "aggiustate": finiscono in "ordini_non_validi".
+# =========================
+SCHEMA_VERSIONE = 2
+CAMPI_DATA = ("data_richiesta", "data_inizio_taglio_gruppo", "inserito_il")
+# date fuori da questo intervallo sono errori di battitura (e mandano in overflow il planner)
+DATA_MIN = date(2000, 1, 1)
+DATA_MAX = date(2100, 12, 31)
+
+def valida_ordine(o: dict):
+    """
+    Ritorna (ordine_normalizzato, errori).
+    Se errori non è vuoto l'ordine normalizzato è None.
+    """
+    errori = []
+
+    try:
+        id_ = int(o.get("id"))
+    except Exception:
+        id_ = None
+        errori.append(f"id non valido: {o.get('id')!r}")
+
+    try:
+        gruppo = int(o.get("ordine_gruppo"))
+    except Exception:
+        gruppo = None
+        errori.append(f"ordine_gruppo non valido: {o.get('ordine_gruppo')!r}")
+
+    materiale = parse_materiale(o.get("materiale"))
+    if materiale is None:
+        errori.append(f"materiale non valido: {o.get('materiale')!r}")
+
+    # chiave assente: Battente, come nel calcolo del carico originale
+    tipologia = norm_tipologia(o.get("tipologia", "Battente"))
+    if tipologia not in TIPOLOGIE:
+        errori.append(f"tipologia non valida: {o.get('tipologia')!r}")
+
+    quantita = {}
+    for campo in ("quantita_strutture", "vetri_totali"):
+        try:
+            quantita[campo] = int(o.get(campo) or 0)
+            if quantita[campo] < 0:
+                errori.append(f"{campo} negativo: {quantita[campo]}")
+        except Exception:
+            errori.append(f"{campo} non valido: {o.get(campo)!r}")
+
+    # senza data inizio taglio vale la data di inserimento (come prima)
+    grezze = dict(o)
+    if not grezze.get("data_inizio_taglio_gruppo"):
+        grezze["data_inizio_taglio_gruppo"] = grezze.get("inserito_il")
+    date_ok = {}
+    for campo in CAMPI_DATA:
+        date_ok[campo] = parse_data(grezze.get(campo))
+        if date_ok[campo] is None:
+            errori.append(f"{campo} non valida: {grezze.get(campo)!r}")
+        elif not (DATA_MIN <= date_ok[campo] <= DATA_MAX):
+            errori.append(f"{campo} fuori intervallo ({DATA_MIN} - {DATA_MAX}): {date_ok[campo]}")
+
+    if errori:
+        return None, errori
+
+    return {
+        "id": id_,
+        "ordine_gruppo": gruppo,
+        "cliente": str(o.get("cliente") or ""),
+        "prodotto": str(o.get("prodotto") or ""),
+        "materiale": materiale,
+        "tipologia": tipologia,
+        "cluster": tipologia_cluster(tipologia),
+        "quantita_strutture": quantita["quantita_strutture"],
+        "vetri_totali": quantita["vetri_totali"] if tipologia == "Battente" else 0,
+        "data_richiesta": date_ok["data_richiesta"],
+        "data_inizio_taglio_gruppo": prossimo_giorno_lavorativo(date_ok["data_inizio_taglio_gruppo"]),
+        "inserito_il": date_ok["inserito_il"],
+    }, []
+
+def max_numerico(valori) -> int:
+    """Massimo tra i valori convertibili a int (0 se nessuno)."""
+    massimo = 0
+    for v in valori:
+        try:
+            massimo = max(massimo, int(v))
+        except Exception:
+            pass
+    return massimo
+
+def migra_dati(grezzi: dict) -> dict:
+    """Porta un file dati allo SCHEMA_VERSIONE corrente, separando le righe non valide."""
+    ordini, non_validi = [], list(grezzi.get("ordini_non_validi", []))
+    for o in grezzi.get("ordini", []):
+        if not isinstance(o, dict):
+            non_validi.append({"ordine": {"valore": o}, "errori": ["riga non è un oggetto"]})
+            continue
+        ordine, errori = valida_ordine(o)
+        if errori:
+            non_validi.append({"ordine": o, "errori": errori})
+        else:
+            ordini.append(ordine)
+    return {"versione_schema": SCHEMA_VERSIONE, "ordini": ordini, "ordini_non_validi": non_validi}
+
 # =========================
 # LOGIN (Streamlit Secrets)
 # =========================
@@ -100,15 +214,51 @@ def check_login() -> bool:
 # =========================
 # STORAGE
 # =========================
+def versione_file_dati():
+    """Versione del file dati (cambia a ogni salvataggio)."""
+    if not os.path.exists(FILE_DATI):
+        return None
+    st_ = os.stat(FILE_DATI)
+    return (st_.st_mtime_ns, st_.st_size)
+
+def dati_vuoti() -> dict:
+    return {"versione_schema": SCHEMA_VERSIONE, "ordini": [], "ordini_non_validi": []}
+
 def carica_dati():
-    if os.path.exists(FILE_DATI):
-        with open(FILE_DATI, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"ordini": []}
+    if not os.path.exists(FILE_DATI):
+        return dati_vuoti()
+
+    with open(FILE_DATI, "r", encoding="utf-8") as f:
+        dati = json.load(f)
+
+    # anche con schema già corrente rivalido le righe (file modificati a mano):
+    # una riga rotta finisce in "ordini_non_validi" invece di bloccare l'app
+    versione = dati.get("versione_schema", 1)
+    migrati = migra_dati(dati)
+
+    if versione < SCHEMA_VERSIONE:
+        # migrazione una tantum, fatta in memoria: se fallisce il file originale resta intatto
+        shutil.copy2(FILE_DATI, f"{FILE_DATI}.v{versione}.bak")
+        salva_dati(migrati)
+    return migrati
 
 def salva_dati(dati):
-    with open(FILE_DATI, "w", encoding="utf-8") as f:
-        json.dump(dati, f, ensure_ascii=False, indent=2)
+    # scrivo su file temporaneo e sostituisco: mai un file dati scritto a metà
+    tmp = f"{FILE_DATI}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dati, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp, FILE_DATI)
+    carica_dati_cached.clear()
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def carica_dati_cached(versione):
+    """
+    Dati letti una volta per versione del file (versione_file_dati), non a ogni rerun.
+    Ritorna (dati, chiave): chiave identifica questo caricamento ed è la chiave
+    della cache degli indici, così un indice corrisponde sempre alle righe caricate.
+    Oggetto condiviso: non va modificato in place.
+    """
+    return carica_dati(), uuid.uuid4().hex
 
 # =========================
 # CAPACITÀ PER FASE (unità/giorno)
@@ -169,13 +319,11 @@ def carico_riga_unita(o: dict) -> tuple[str, int]:
       - Battente -> qta = vetri_totali
       - Scorrevole/Speciale -> qta = quantita_strutture
     """
-    tip = tipologia_cluster(o.get("tipologia", "Battente"))
+    tip = o["cluster"]
     if tip == "Battente":
-        q = int(o.get("vetri_totali", 0) or 0)
-        return tip, max(0, q)
+        return tip, o["vetri_totali"]
     else:
-        q = int(o.get("quantita_strutture", 0) or 0)
-        return tip, max(0, q)
+        return tip, o["quantita_strutture"]
 
 # =========================
 # BUILD NEEDS per fase
@@ -188,13 +336,13 @@ def build_group_meta(dati: dict):
             meta[g] = {
                 "Cliente": o.get("cliente", ""),
                 "Prodotto": o.get("prodotto", ""),
-                "Inserito": safe_date(o.get("inserito_il") or date.today()),
-                "StartTaglio": safe_date(o.get("data_inizio_taglio_gruppo") or o.get("inserito_il") or date.today()),
+                "Inserito": o["inserito_il"],
+                "StartTaglio": o["data_inizio_taglio_gruppo"],
             }
         else:
             # tengo il più vecchio come data inserimento, e start taglio più vecchio
-            meta[g]["Inserito"] = min(meta[g]["Inserito"], safe_date(o.get("inserito_il") or date.today()))
-            meta[g]["StartTaglio"] = min(meta[g]["StartTaglio"], safe_date(o.get("data_inizio_taglio_gruppo") or o.get("inserito_il") or date.today()))
+            meta[g]["Inserito"] = min(meta[g]["Inserito"], o["inserito_il"])
+            meta[g]["StartTaglio"] = min(meta[g]["StartTaglio"], o["data_inizio_taglio_gruppo"])
     return meta
 
 def build_needs_by_phase(dati: dict):
@@ -208,7 +356,7 @@ def build_needs_by_phase(dati: dict):
 
     for o in dati.get("ordini", []):
         g = str(o.get("ordine_gruppo"))
-        mat = norm_materiale(o.get("materiale", "PVC"))
+        mat = o["materiale"]
         cluster, qta = carico_riga_unita(o)
         if qta <= 0:
             continue
@@ -433,15 +581,92 @@ def calcola_piani_fasi(dati: dict):
     consegne.sort(key=lambda x: int(x["Gruppo"]) if x["Gruppo"].isdigit() else 10**9)
     return plans, consegne
 
+def impronta(rows: list) -> str:
+    """Impronta (hash) di una lista di righe: cambia solo se cambiano le righe."""
+    return hashlib.sha1(json.dumps(rows, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def impronte_piani(plans: dict, consegne: list) -> dict:
+    """Impronta per ogni fase + "Consegne" (chiavi per le cache di Gantt e tabelle)."""
+    impronte = {fase: impronta(rows) for fase, rows in plans.items()}
+    impronte["Consegne"] = impronta(consegne)
+    return impronte
+
+# =========================
+# RICALCOLO PIANI IN BACKGROUND
+# =========================
+class PianificatoreBackground:
+    """
+    Ricalcola i piani in un thread separato, così lo script Streamlit non resta bloccato.
+    - richiedi(dati): accoda un ricalcolo; se uno è già in corso, le richieste
+      successive vengono fuse in un unico ricalcolo con i dati più recenti.
+    - stato(): fotografia dell'ultimo piano completato + flag "in corso".
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pending = None
+        self._plans = None
+        self._consegne = None
+        self._impronte = {}
+        self._versione = 0
+        self._errore = None
+        self._avviato = False
+
+    def richiedi(self, dati: dict):
+        with self._lock:
+            self._avviato = True
+            # copia: il thread non deve vedere modifiche successive della UI
+            self._pending = copy.deepcopy(dati)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                dati = self._pending
+                self._pending = None
+                if dati is None:
+                    self._thread = None
+                    return
+            try:
+                plans, consegne = calcola_piani_fasi(dati)
+                impronte = impronte_piani(plans, consegne)
+                errore = None
+            except Exception as e:
+                plans, consegne, impronte, errore = None, None, {}, str(e)
+
+            with self._lock:
+                if errore is None:
+                    self._plans = plans
+                    self._consegne = consegne
+                    self._impronte = impronte
+                    self._versione += 1
+                self._errore = errore
+
+    def stato(self) -> dict:
+        with self._lock:
+            return {
+                "plans": self._plans,
+                "consegne": self._consegne,
+                "impronte": self._impronte,
+                "versione": self._versione,
+                "errore": self._errore,
+                "in_corso": self._thread is not None,
+                "avviato": self._avviato,
+            }
+
 # =========================
 # GANTT (giorno per giorno)
 # =========================
-def render_gantt(df_phase: pd.DataFrame, title: str):
-    st.subheader(title)
+# max spec Gantt tenute in cache (7 grafici per piano -> ~9 piani recenti)
+GANTT_CACHE_MAX = 64
 
+def build_gantt_spec(df_phase: pd.DataFrame):
+    """Costruisce il Gantt (ghost + barre + testo) e ritorna la spec Vega-Lite serializzata, o None se vuoto."""
     if df_phase.empty:
-        st.info("Nessun dato.")
-        return
+        return None
 
     df_phase = df_phase.copy()
     df_phase["Data"] = pd.to_datetime(df_phase["Data"])
@@ -515,7 +740,147 @@ def render_gantt(df_phase: pd.DataFrame, title: str):
         height=max(380, 70 * len(agg["Commessa"].unique()))
     )
 
-    st.altair_chart(chart, use_container_width=True)
+    # senza il limite di 5000 righe del transformer di default (come faceva st.altair_chart)
+    with alt.data_transformers.disable_max_rows():
+        return chart.to_dict()
+
+@st.cache_data(max_entries=GANTT_CACHE_MAX, show_spinner=False)
+def gantt_spec_cached(impronta_fase: str, fase: str, materiale, _rows: list):
+    """
+    Spec del Gantt memorizzata per (impronta_fase, fase, materiale).
+    _rows non viene hashato da Streamlit: la chiave è l'impronta calcolata dal pianificatore.
+    """
+    df_phase = pd.DataFrame(_rows)
+    if materiale is not None and not df_phase.empty:
+        df_phase = df_phase[df_phase["Materiale"] == materiale]
+    return build_gantt_spec(df_phase)
+
+def render_gantt(plans: dict, impronte: dict, fase: str, materiale, title: str):
+    st.subheader(title)
+
+    spec = gantt_spec_cached(impronte.get(fase, ""), fase, materiale, plans.get(fase, []))
+    if spec is None:
+        st.info("Nessun dato.")
+        return
+
+    st.vega_lite_chart(spec, use_container_width=True)
+
+# =========================
+# TABELLE: indici, filtri, paginazione
+# (gli indici si costruiscono una volta per versione dati; al browser va solo la pagina visibile)
+# =========================
+RIGHE_PER_PAGINA = 50
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def indici_tabella(chiave, campi: tuple, campo_data: str, _righe: list) -> dict:
+    """
+    Indici per la tabella _righe (non hashata: chiave identifica le righe, es. caricamento dati o impronta consegne):
+      - per_campo[campo][valore] = posizioni (crescenti)
+      - date / pos_date: date ordinate e posizioni corrispondenti (filtro intervallo con bisect)
+    """
+    per_campo = {c: {} for c in campi}
+    con_data = []
+    for i, r in enumerate(_righe):
+        for c in campi:
+            per_campo[c].setdefault(r.get(c), []).append(i)
+        d = parse_data(r.get(campo_data))
+        if d is not None:
+            con_data.append((d, i))
+    con_data.sort()
+    return {
+        "n": len(_righe),
+        "per_campo": per_campo,
+        "date": [d for d, _ in con_data],
+        "pos_date": [i for _, i in con_data],
+    }
+
+def filtra_posizioni(indici: dict, selezioni: dict, intervallo):
+    """Posizioni (crescenti) delle righe che rispettano i filtri; None = nessun filtro (tutte)."""
+    insiemi = []
+    for campo, valori in selezioni.items():
+        if valori is not None:
+            pos = set()
+            for v in valori:
+                pos.update(indici["per_campo"][campo].get(v, []))
+            insiemi.append(pos)
+
+    if intervallo:
+        da, a = intervallo
+        lo = bisect.bisect_left(indici["date"], da)
+        hi = bisect.bisect_right(indici["date"], a)
+        insiemi.append(set(indici["pos_date"][lo:hi]))
+
+    if not insiemi:
+        return None
+    insiemi.sort(key=len)
+    return sorted(set.intersection(*insiemi))
+
+def chiave_valore(v):
+    """Ordinamento: prima i valori numerici (anche "10" come stringa) in ordine numerico, poi il resto."""
+    try:
+        return (0, int(v), "")
+    except Exception:
+        return (1, 0, str(v))
+
+def valori_da_filtro(indici: dict, campo: str, tipo: str, testo: str):
+    """
+    Traduce il testo di un filtro nei valori dell'indice che lo rispettano (None = filtro vuoto).
+      - "testo": contiene (senza maiuscole/minuscole)
+      - "lista": uno dei valori separati da virgola (es. gruppi "12, 15")
+    """
+    testo = (testo or "").strip()
+    if not testo:
+        return None
+    valori = indici["per_campo"][campo]
+    if tipo == "testo":
+        t = testo.lower()
+        return [v for v in valori if t in str(v).lower()]
+    cercati = {x.strip() for x in testo.split(",") if x.strip()}
+    return [v for v in valori if str(v) in cercati]
+
+def tabella_paginata(righe: list, indici: dict, key: str, filtri: dict, etichetta_data: str):
+    """
+    Filtri (per campo + intervallo date) e paginazione lato server.
+    filtri: {etichetta: (campo, tipo)} con tipo:
+      - "scelta": multiselect sui valori (solo campi con pochi valori, es. materiale)
+      - "testo" / "lista": casella di testo (campi con molti valori: cliente, gruppo)
+    """
+    with st.expander("🔎 Filtri"):
+        cols = st.columns(len(filtri) + 1)
+        selezioni = {}
+        for col, (etichetta, (campo, tipo)) in zip(cols, filtri.items()):
+            if tipo == "scelta":
+                opzioni = sorted((v for v in indici["per_campo"][campo] if v is not None), key=chiave_valore)
+                scelti = col.multiselect(etichetta, opzioni, key=f"{key}_{campo}")
+                selezioni[campo] = scelti or None
+            else:
+                aiuto = "Parte del nome" if tipo == "testo" else "Valori separati da virgola"
+                testo = col.text_input(etichetta, key=f"{key}_{campo}", help=aiuto)
+                selezioni[campo] = valori_da_filtro(indici, campo, tipo, testo)
+        intervallo = cols[-1].date_input(etichetta_data, value=(), key=f"{key}_date")
+        # durante la selezione date_input può restituire un solo estremo
+        intervallo = tuple(intervallo) if isinstance(intervallo, (tuple, list)) and len(intervallo) == 2 else None
+
+    posizioni = filtra_posizioni(indici, selezioni, intervallo)
+    totale = indici["n"] if posizioni is None else len(posizioni)
+    n_pagine = max(1, math.ceil(totale / RIGHE_PER_PAGINA))
+
+    key_pagina = f"{key}_pagina"
+    if st.session_state.get(key_pagina, 1) > n_pagine:
+        st.session_state[key_pagina] = 1
+
+    cpag, cinfo = st.columns([1, 3])
+    pagina = cpag.number_input("Pagina", min_value=1, max_value=n_pagine, step=1, key=key_pagina)
+    cinfo.caption(f"{totale} righe · pagina {pagina}/{n_pagine}")
+
+    inizio = (pagina - 1) * RIGHE_PER_PAGINA
+    fine = inizio + RIGHE_PER_PAGINA
+    if posizioni is None:
+        pagina_righe = righe[inizio:fine]
+    else:
+        pagina_righe = [righe[i] for i in posizioni[inizio:fine]]
+
+    st.dataframe(pd.DataFrame(pagina_righe), use_container_width=True, hide_index=True)
 
 # =========================
 # UI APP
@@ -527,7 +892,16 @@ if not check_login():
 
 st.title("📦 Planner Produzione (Fasi + Gantt multipli)")
 
-dati = carica_dati()
+dati, chiave_dati = carica_dati_cached(versione_file_dati())
+
+if "pianificatore" not in st.session_state:
+    st.session_state["pianificatore"] = PianificatoreBackground()
+pianificatore = st.session_state["pianificatore"]
+
+# primo avvio: calcolo subito il piano sui dati salvati (una sola volta per sessione:
+# se fallisce non riprovo da solo, riparte con "Calcola piani" o con un salvataggio)
+if not pianificatore.stato()["avviato"] and dati.get("ordini"):
+    pianificatore.richiedi(dati)
 
 if "righe_correnti" not in st.session_state:
     st.session_state["righe_correnti"] = []
@@ -560,8 +934,8 @@ with col2:
     data_inizio_taglio = st.date_input("Data inizio TAGLIO (gruppo)", value=prossimo_giorno_lavorativo(date.today()))
 
     st.markdown("### Aggiungi riga ordine")
-    materiale = st.selectbox("Materiale riga", ["PVC", "Alluminio"])
-    tipologia = st.selectbox("Tipologia riga", ["Battente", "Scorrevole", "Struttura speciale"])
+    materiale = st.selectbox("Materiale riga", list(MATERIALI))
+    tipologia = st.selectbox("Tipologia riga", list(TIPOLOGIE))
     quantita_strutture = st.number_input("Quantità strutture (riga)", min_value=1, value=1, step=1)
 
     if tipologia == "Battente":
@@ -584,8 +958,8 @@ with col2:
     with cadd:
         if st.button("➕ Aggiungi riga"):
             st.session_state["righe_correnti"].append({
-                "materiale": norm_materiale(materiale),
-                "tipologia": norm_tipologia(tipologia),
+                "materiale": materiale,
+                "tipologia": tipologia,
                 "quantita_strutture": int(quantita_strutture),
                 "vetri_totali": int(vetri_totali) if tipologia == "Battente" else 0,
             })
@@ -610,57 +984,73 @@ with col2:
             st.error("Aggiungi almeno una riga ordine.")
         else:
             ordini_esistenti = dati.get("ordini", [])
-            max_gruppo = 0
-            for oo in ordini_esistenti:
-                try:
-                    max_gruppo = max(max_gruppo, int(oo.get("ordine_gruppo", 0)))
-                except Exception:
-                    pass
-            ordine_gruppo = max_gruppo + 1
-
-            for r in st.session_state["righe_correnti"]:
-                nuovo = {
-                    "id": len(dati["ordini"]) + 1,
+            # considero anche le righe non valide: gruppo e id non devono essere riusati
+            scartati = [x["ordine"] for x in dati.get("ordini_non_validi", [])]
+            ordine_gruppo = max_numerico(oo.get("ordine_gruppo") for oo in ordini_esistenti + scartati) + 1
+            max_id = max_numerico(oo.get("id") for oo in ordini_esistenti + scartati)
+
+            nuovi, errori = [], []
+            for i, r in enumerate(st.session_state["righe_correnti"], start=1):
+                nuovo, err = valida_ordine({
+                    "id": max_id + i,
                     "ordine_gruppo": ordine_gruppo,
                     "cliente": cliente,
                     "prodotto": prodotto,
-                    "materiale": norm_materiale(r["materiale"]),
-                    "tipologia": norm_tipologia(r["tipologia"]),
-                    "quantita_strutture": int(r["quantita_strutture"]),
-                    "vetri_totali": int(r["vetri_totali"]),
-                    "data_richiesta": str(data_richiesta),
-                    "data_inizio_taglio_gruppo": str(prossimo_giorno_lavorativo(data_inizio_taglio)),
-                    "inserito_il": str(date.today()),
-                }
-                dati["ordini"].append(nuovo)
-
-            salva_dati(dati)
-            st.session_state["righe_correnti"] = []
-            st.success(f"Ordine salvato (gruppo {ordine_gruppo}) - inizio TAGLIO: {prossimo_giorno_lavorativo(data_inizio_taglio)}")
-            st.rerun()
+                    "materiale": r["materiale"],
+                    "tipologia": r["tipologia"],
+                    "quantita_strutture": r["quantita_strutture"],
+                    "vetri_totali": r["vetri_totali"],
+                    "data_richiesta": data_richiesta,
+                    "data_inizio_taglio_gruppo": data_inizio_taglio,
+                    "inserito_il": date.today(),
+                })
+                nuovi.append(nuovo)
+                errori.extend(f"Riga {i}: {e}" for e in err)
+
+            if errori:
+                st.error("Ordine non salvato:\n" + "\n".join(f"- {e}" for e in errori))
+            else:
+                # nuovo dict: quello caricato è condiviso dalla cache
+                dati = {**dati, "ordini": dati["ordini"] + nuovi}
+                salva_dati(dati)
+                pianificatore.richiedi(dati)
+                st.session_state["righe_correnti"] = []
+                st.success(f"Ordine salvato (gruppo {ordine_gruppo}) - inizio TAGLIO: {prossimo_giorno_lavorativo(data_inizio_taglio)}")
+                st.rerun()
 
 st.divider()
 
 st.subheader("📋 Ordini (righe)")
 if dati.get("ordini"):
-    st.dataframe(dati["ordini"], use_container_width=True)
+    indici_ordini = indici_tabella(
+        chiave_dati, ("cliente", "ordine_gruppo", "materiale"), "data_richiesta", dati["ordini"]
+    )
+    tabella_paginata(
+        dati["ordini"], indici_ordini, "tab_ordini",
+        {"Cliente": ("cliente", "testo"), "Gruppo": ("ordine_gruppo", "lista"), "Materiale": ("materiale", "scelta")},
+        "Data richiesta (da - a)",
+    )
 else:
     st.info("Nessun ordine inserito.")
 
+if dati.get("ordini_non_validi"):
+    with st.expander(f"⚠️ {len(dati['ordini_non_validi'])} righe ordine non valide (escluse dalla pianificazione)"):
+        st.dataframe(
+            [{"errori": "; ".join(x["errori"]), **x["ordine"]} for x in dati["ordini_non_validi"]],
+            use_container_width=True,
+        )
+
 c1, c2, c3 = st.columns([1, 1, 2])
 
 with c1:
     if st.button("📅 Calcola piani + Gantt"):
-        plans, consegne = calcola_piani_fasi(dati)
-        st.session_state["plans"] = plans
-        st.session_state["consegne"] = consegne
+        pianificatore.richiedi(dati)
 
 with c2:
     if st.button("🗑️ Cancella tutto"):
-        dati = {"ordini": []}
+        dati = dati_vuoti()
         salva_dati(dati)
-        st.session_state.pop("plans", None)
-        st.session_state.pop("consegne", None)
+        pianificatore.richiedi(dati)
         st.session_state["righe_correnti"] = []
         st.warning("Ordini cancellati")
         st.rerun()
@@ -670,64 +1060,66 @@ with c3:
         st.session_state.logged_in = False
         st.rerun()
 
-if "consegne" in st.session_state:
-    st.subheader("✅ Consegne stimate (fine ultima fase + 3 gg lavorativi)")
-    st.dataframe(st.session_state["consegne"], use_container_width=True)
-
 # =========================
-# GANTT MULTIPLI
+# CONSEGNE + GANTT MULTIPLI
+# (mostro sempre l'ultimo piano completato; mentre il thread ricalcola,
+#  il frammento si aggiorna da solo e sostituisce il piano quando è pronto)
 # =========================
-if "plans" in st.session_state:
-    plans = st.session_state["plans"]
+def mostra_piani(versione_mostrata: int, in_polling: bool):
+    stato = pianificatore.stato()
+
+    if stato["versione"] != versione_mostrata or (in_polling and not stato["in_corso"]):
+        # ricalcolo finito (nuovo piano o errore): rerun completo per ridisegnare e fermare il polling
+        st.rerun()
+
+    if stato["in_corso"]:
+        st.info("⏳ Ricalcolo piani in corso… (mostro l'ultimo piano calcolato)")
+    if stato["errore"]:
+        st.error(f"Errore nel calcolo dei piani: {stato['errore']}")
+
+    plans = stato["plans"]
+    consegne = stato["consegne"]
+    if not plans and not consegne:
+        return
+
+    impronte = stato["impronte"]
+
+    st.subheader("✅ Consegne stimate (fine ultima fase + 3 gg lavorativi)")
+    if consegne:
+        indici_consegne = indici_tabella(impronte["Consegne"], ("Cliente", "Gruppo"), "Stimata", consegne)
+        tabella_paginata(
+            consegne, indici_consegne, "tab_consegne",
+            {"Cliente": ("Cliente", "testo"), "Gruppo": ("Gruppo", "lista")},
+            "Consegna stimata (da - a)",
+        )
+    else:
+        st.info("Nessuna consegna.")
 
     # Taglio: separo PVC e Alluminio
-    df_taglio = pd.DataFrame(plans.get("Taglio", []))
-    if not df_taglio.empty:
-        render_gantt(df_taglio[df_taglio["Materiale"] == "PVC"], "✂️ Gantt TAGLIO - PVC")
-        render_gantt(df_taglio[df_taglio["Materiale"] == "Alluminio"], "✂️ Gantt TAGLIO - Alluminio")
+    if plans.get("Taglio"):
+        render_gantt(plans, impronte, "Taglio", "PVC", "✂️ Gantt TAGLIO - PVC")
+        render_gantt(plans, impronte, "Taglio", "Alluminio", "✂️ Gantt TAGLIO - Alluminio")
     else:
         st.subheader("✂️ Gantt TAGLIO")
         st.info("Nessun dato.")
 
     # Saldatura: solo PVC
-    df_sald = pd.DataFrame(plans.get("Saldatura", []))
-    render_gantt(df_sald, "🔥 Gantt SALDATURA - PVC")
+    render_gantt(plans, impronte, "Saldatura", None, "🔥 Gantt SALDATURA - PVC")
 
     # Assemblaggio: separo PVC e Alluminio
-    df_ass = pd.DataFrame(plans.get("Assemblaggio", []))
-    if not df_ass.empty:
-        render_gantt(df_ass[df_ass["Materiale"] == "PVC"], "🧩 Gantt ASSEMBLAGGIO - PVC")
-        render_gantt(df_ass[df_ass["Materiale"] == "Alluminio"], "🧩 Gantt ASSEMBLAGGIO - Alluminio")
+    if plans.get("Assemblaggio"):
+        render_gantt(plans, impronte, "Assemblaggio", "PVC", "🧩 Gantt ASSEMBLAGGIO - PVC")
+        render_gantt(plans, impronte, "Assemblaggio", "Alluminio", "🧩 Gantt ASSEMBLAGGIO - Alluminio")
     else:
         st.subheader("🧩 Gantt ASSEMBLAGGIO")
         st.info("Nessun dato.")
 
     # Vetrazione: unica (Materiale = ALL)
-    df_vet = pd.DataFrame(plans.get("Vetrazione", []))
-    render_gantt(df_vet, "🪟 Gantt VETRAZIONE (PVC + Alluminio)")
+    render_gantt(plans, impronte, "Vetrazione", None, "🪟 Gantt VETRAZIONE (PVC + Alluminio)")
 
     # Imballaggio: unico
-    df_imb = pd.DataFrame(plans.get("Imballaggio", []))
-    render_gantt(df_imb, "📦 Gantt IMBALLAGGIO (PVC + Alluminio)")
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    render_gantt(plans, impronte, "Imballaggio", None, "📦 Gantt IMBALLAGGIO (PVC + Alluminio)")
 
+_stato = pianificatore.stato()
+# polling solo mentre il ricalcolo è in corso
+st.fragment(run_every=1.0 if _stato["in_corso"] else None)(mostra_piani)(_stato["versione"], _stato["in_corso"])